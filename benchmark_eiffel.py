@@ -0,0 +1,56 @@
+"""Benchmark the invariant checks of deeply nested public method calls.
+
+Each graph is a class whose public method ``level_<n>`` calls ``level_<n-1>``
+``fanout`` times on the same instance. Only the outermost call should check
+the invariant, so the number of checks per call must be one.
+
+Run it with: python benchmark_eiffel.py
+"""
+
+import timeit
+
+import eiffel
+
+
+def make_graph(depth: int, fanout: int) -> type:
+    namespace = {}
+
+    def leaf(self):
+        self.value = self.value + 1
+
+    namespace["level_0"] = leaf
+    for level in range(1, depth + 1):
+        def node(self, _inner=f"level_{level - 1}"):
+            for _ in range(fanout):
+                getattr(self, _inner)()
+        node.__name__ = f"level_{level}"
+        namespace[node.__name__] = node
+
+    def __init__(self):
+        self.value = 0
+
+    def __invariant__(self):
+        object.__setattr__(self, "checks", self.checks + 1)
+        assert self.value >= 0
+
+    namespace["checks"] = 0
+    namespace["__init__"] = __init__
+    namespace["__invariant__"] = __invariant__
+    return type(f"Graph{depth}x{fanout}", (eiffel.Class,), namespace)
+
+
+def main() -> None:
+    for depth, fanout in [(1, 1), (4, 2), (8, 2), (16, 1), (64, 1)]:
+        graph = make_graph(depth, fanout)()
+        method = getattr(graph, f"level_{depth}")
+        number = 1000
+        checks = graph.checks
+        seconds = timeit.timeit(method, number=number)
+        calls = sum(fanout ** level for level in range(depth + 1))
+        print(f"depth={depth:<3} fanout={fanout} calls={calls:<4} "
+              f"checks/call={(graph.checks - checks) / number:.1f} "
+              f"{seconds / number * 1e6:.1f} us/call")
+
+
+if __name__ == "__main__":
+    main()
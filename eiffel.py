@@ -1,12 +1,32 @@
 """A Python Design By Contract module."""
 
+import abc
+import ast
+import asyncio
+import concurrent.futures
 import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import string
 import sys
+import textwrap
+import threading
+import traceback
 import types
-from typing import Callable, Any, Optional, Dict, Tuple
+import weakref
+from random import Random
+from typing import (
+    Callable, Any, Optional, Dict, Tuple, List, Iterator, Sequence, IO,
+    Set, Awaitable, Type)
 
 
-__all__ = ["Class", "__setattr__", "__delattr__", "routine", "require", "old"]
+__all__ = ["Class", "__setattr__", "__delattr__", "routine", "require", "old",
+           "defer", "shadow",
+           "Falsified", "fuzz", "integers", "floats", "sampled_from", "lists",
+           "text", "Coverage"]
 __version__ = "0.3.4"
 
 TKwArgs = Dict[str, Any]
@@ -24,27 +44,142 @@ DelAttrType = Callable[[Any, str], None]
 #
 # __setattr__ and __delattr__ must also be overrided, because they change the
 # state of the instance.
+#
+# Only the outermost public call checks the invariant. When a public method
+# calls other public methods of the same instance, the inner calls are not
+# qualified calls, so they do not check the invariant, and neither does
+# __setattr__ or __delattr__ while the method runs. The calls are tracked per
+# task or thread that runs them, so a call running in one of them does not
+# disable the checks of the others.
+#
+# Each running call of an instance also has an undo log. The first time an
+# attribute is assigned or deleted during the call, __setattr__ and
+# __delattr__ store its previous value in the log. So "eiffel.old(self)" can
+# read the state of the instance on entry to the call, paying only for the
+# attributes that actually changed. Changes made by other threads and tasks
+# are stored too.
+#
+# The registry maps each instance to the stack of logs of each task or
+# thread that runs one of its public methods. A change is stored only in the
+# log on the top of each stack. When an inner call returns, its log is merged
+# in the log of the outer call: the values that the outer log does not have
+# did not change between the entries to both calls.
+
+TChanges = List[Dict[str, Any]]
+
+_running: Dict[int, Dict[Any, TChanges]] = {}
+_running_lock = threading.Lock()
+
+# Marks an attribute that did not exist.
+_MISSING = object()
+
+
+def _owner() -> Any:
+    """Return the running asyncio task, or else the id of the thread."""
+    loop = asyncio._get_running_loop()
+    task = asyncio.current_task(loop) if loop is not None else None
+    return threading.get_ident() if task is None else task
+
+
+def _running_changes(self: Any) -> Optional[TChanges]:
+    """Return the undo logs of the public calls that are running on the
+    instance in this task or thread, if any."""
+    owners = _running.get(id(self))
+    return owners.get(_owner()) if owners else None
+
+
+def _enter(self: Any) -> Tuple[Any, TChanges]:
+    """Register the outermost call of this task or thread."""
+    owner = _owner()
+    changes: TChanges = [{}]
+    with _running_lock:
+        _running.setdefault(id(self), {})[owner] = changes
+    return owner, changes
+
+
+def _exit(self: Any, owner: Any) -> None:
+    with _running_lock:
+        owners = _running[id(self)]
+        del owners[owner]
+        if not owners:
+            del _running[id(self)]
+
+
+def _merge_changes(changes: TChanges) -> None:
+    log = changes.pop()
+    for name, value in log.items():
+        changes[-1].setdefault(name, value)
 
 
 def _constraint_checker(
     function: Callable[..., Any]
 ) -> Callable[[Any], Any]:
+    if inspect.iscoroutinefunction(function):
+        return _async_constraint_checker(function)
+
     @functools.wraps(function)
     def wrapper(self: Any, *args: TArgs, **kwargs: TKwArgs) -> Any:
+        changes = _running_changes(self)
+        if changes is not None:
+            changes.append({})
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                _merge_changes(changes)
 
-        # Disable the constraint tester of __setattr__ and __delattr__
-        # functions to ensure that __invariant__ are called only once, and
-        # only after the method invocation.
-        object.__setattr__(self, "_invariant_enabled", False)
+        # Disable the constraint tester of nested calls, __setattr__ and
+        # __delattr__ functions to ensure that __invariant__ are called only
+        # once, and only after the method invocation.
+        owner, changes = _enter(self)
         try:
             result = function(self, *args, **kwargs)
-            self.__invariant__()  # check the contract
+            if self._invariant_enabled:
+                _check_invariant(self)  # check the contract
         finally:
-            object.__setattr__(self, "_invariant_enabled", True)
+            _exit(self, owner)
         return result
     return wrapper
 
 
+def _async_constraint_checker(
+    function: Callable[..., Any]
+) -> Callable[[Any], Any]:
+    @functools.wraps(function)
+    async def wrapper(self: Any, *args: TArgs, **kwargs: TKwArgs) -> Any:
+        changes = _running_changes(self)
+        if changes is not None:
+            changes.append({})
+            try:
+                return await function(self, *args, **kwargs)
+            finally:
+                _merge_changes(changes)
+        owner, changes = _enter(self)
+        try:
+            result = await function(self, *args, **kwargs)
+            if self._invariant_enabled:
+                _check_invariant(self)
+                await self.__ainvariant__()
+        finally:
+            _exit(self, owner)
+        return result
+    return wrapper
+
+
+def _save_entry_value(self: Any, name: str) -> None:
+    """Store the value of the attribute in the logs of the running calls,
+    before it changes."""
+    owners = _running.get(id(self))
+    if not owners:
+        return
+
+    # The setter of a property stores the attributes that it changes.
+    if isinstance(getattr(type(self), name, None), property):
+        return
+    value = getattr(self, name, _MISSING)
+    for changes in list(owners.values()):
+        changes[-1].setdefault(name, value)
+
+
 # I define __setattr__ and __delattr__ here
 # because they will be part of the public API.
 
@@ -53,17 +188,19 @@ if __debug__:
         """Assigns the value to the attribute, then
         check that the invariant are maintaned."""
 
+        _save_entry_value(self, name)
         object.__setattr__(self, name, value)
-        if self._invariant_enabled:
-            self.__invariant__()
+        if self._invariant_enabled and _running_changes(self) is None:
+            _check_invariant(self)
 
     def __delattr__(self: Any, name: str) -> None:
         """Delete the attribute, then check
         that the invariant are maintaned."""
 
+        _save_entry_value(self, name)
         object.__delattr__(self, name)
-        if self._invariant_enabled:
-            self.__invariant__()
+        if self._invariant_enabled and _running_changes(self) is None:
+            _check_invariant(self)
 else:
     __setattr__: SetAttrType = object.__setattr__  # type: ignore[no-redef]
     __delattr__: DelAttrType = object.__delattr__  # type: ignore[no-redef]
@@ -73,8 +210,13 @@ class Class:
     """Make a class that can define invariants."""
 
     if __debug__:
+        # Set it to False in an instance to stop checking its invariant.
         _invariant_enabled = True
 
+        # Check __invariant__ in the background thread of eiffel.shadow,
+        # with the attributes returned by __snapshot__.
+        __shadow__ = False
+
         # Override defaults methods with the new ones.
         __delattr__ = __delattr__
         __setattr__ = __setattr__
@@ -82,11 +224,25 @@ class Class:
         def __invariant__(self) -> None:
             pass
 
-        def __init_subclas__(cls) -> None:
-            base_vars = vars(cls.__base__)  # type: ignore[attr-defined]
+        async def __ainvariant__(self) -> None:
+            pass
+
+        def __snapshot__(self) -> Dict[str, Any]:
+            """Return a shallow copy of the attributes. The caller can change
+            mutable attributes while the background thread reads them, so
+            override it to copy them deeply if that is a problem."""
+            return dict(vars(self))
+
+        def __init_subclass__(cls) -> None:
+            base = cls.__base__  # type: ignore[attr-defined]
             for name, member in vars(cls).items():
-                if name not in base_vars \
-                and callable(member) \
+                function = getattr(member, "__func__", member)
+                if isinstance(function, types.FunctionType):
+                    _register_contract(function)
+
+                # Methods taken from the base class are already wrapped.
+                if member is not getattr(base, name, None) \
+                and isinstance(member, types.FunctionType) \
                 and not name.startswith("_"):  # noqa
                     setattr(cls, name, _constraint_checker(member))
             super().__init_subclass__()
@@ -98,31 +254,108 @@ def routine(function: Callable[..., Any]) -> Callable[..., Any]:
     if not __debug__:
         return function
 
+    _register_contract(function)
+
     # NOTE 1: this object will be  filled by get_old function.
     __old__: list[TKwArgs] = [{}]
 
+    # NOTE 2: each call has its own __old_keys__ list, that get_old fills
+    # with the key that the call adds to the 'old' namespace.
+
+    if inspect.iscoroutinefunction(function):
+
+        # The frame of the coroutine is linked to the frame of this wrapper
+        # while it runs, so the 'old' object finds __old__ as usual.
+        @functools.wraps(function)
+        async def async_wrapper(*args: TArgs, **kwargs: TKwArgs) -> Any:
+            __old_keys__: List[int] = []
+            try:
+                result = __old__[0]["__result__"] = \
+                    await function(*args, **kwargs)
+            finally:
+                _forget_old(__old_keys__)
+            return result
+
+        return async_wrapper
+
     @functools.wraps(function)
     def wrapper(*args: TArgs, **kwargs: TKwArgs) -> Any:
-        result = __old__[0]["__result__"] = function(*args, **kwargs)
+        __old_keys__: List[int] = []
+        try:
+            result = __old__[0]["__result__"] = function(*args, **kwargs)
+        finally:
+            _forget_old(__old_keys__)
         return result
 
     return wrapper
 
 
+def _forget_old(keys: List[int]) -> None:
+    # The id of a finished frame can be reused by other frame, so its entry
+    # must not stay in the 'old' namespace.
+    for key in keys:
+        old.namespace.pop(key, None)
+
+
 class _Require:
     def __enter__(self) -> None:
         pass
 
-    def __exit__(*args) -> None:
-        pass
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        # Tag the failed precondition with the code of the routine that
+        # declares it. So the caller can tell a rejected input apart from an
+        # AssertionError raised by the body or by a nested routine.
+        if isinstance(exc_value, AssertionError):
+            setattr(exc_value, "_eiffel_require", sys._getframe(1).f_code)
 
 
 require = _Require()
 
 
+class _EntryState:
+    """Read only view of an instance on entry to the running call."""
+
+    # Mangled names, so they do not hide the attributes of the instance.
+    __slots__ = ("__instance", "__log")
+
+    def __init__(self, instance: Any, log: Dict[str, Any]) -> None:
+        self.__instance = instance
+        self.__log = log
+
+    def __getattr__(self, name: str) -> Any:
+        if name in self.__log:
+            value = self.__log[name]
+            if value is _MISSING:
+                raise AttributeError(
+                    f"'{type(self.__instance).__name__}' object had no "
+                    f"attribute '{name}' on entry")
+            return value
+
+        # Evaluate properties and methods with the entry values of the
+        # attributes. Methods run without checking the invariant.
+        attribute = getattr(type(self.__instance), name, None)
+        if isinstance(attribute, property):
+            return attribute.__get__(self)
+        if isinstance(attribute, types.FunctionType):
+            return types.MethodType(inspect.unwrap(attribute), self)
+        return getattr(self.__instance, name)
+
+
 class _Old:
     namespace: Dict[int, TKwArgs] = {}
 
+    def __call__(self, instance: Any) -> Any:
+        """Return the state of the instance on entry to the running public
+        method."""
+        if not __debug__:
+            return instance
+        changes = _running_changes(instance)
+        if changes is None:
+            raise ValueError(
+                "'old' can only be called with an 'eiffel.Class' instance "
+                "inside one of its public methods.")
+        return _EntryState(instance, changes[-1])
+
     def __bool__(self) -> bool:
         """Lookup the local namespace of the last function call."""
         if not __debug__:
@@ -148,6 +381,9 @@ class _Old:
             locals_, old_locals[0] = old_locals[0], function_frame.f_locals
             if locals_:
                 self.namespace[id(function_frame)] = locals_
+
+                # __old_keys__ is the one indicated in NOTE 2
+                wrapper_locals["__old_keys__"].append(id(function_frame))
                 return True
 
         return False
@@ -164,3 +400,698 @@ class _Old:
 
 
 old = _Old()
+
+
+# Asynchronous Checks
+# ===================
+#
+# Expensive checks, like the consistency against a database, can be scheduled
+# as background tasks, so they do not add latency to the routine. The number
+# of checks that run at the same time on each event loop is bounded by a
+# semaphore. The number of pending checks is also bounded: when it is reached,
+# new checks are dropped and counted. Failures are reported to the exception
+# handler of the loop.
+
+
+class _Defer:
+    limit = 8
+    maxsize = 1024
+
+    def __init__(self) -> None:
+        self.dropped = 0
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._semaphores: "weakref.WeakKeyDictionary[Any, asyncio.Semaphore]" \
+            = weakref.WeakKeyDictionary()
+
+    def __call__(self, check: Awaitable[Any]) -> None:
+        """Schedule the check in the running event loop."""
+        if not __debug__ or len(self._tasks) >= self.maxsize:
+            if __debug__:
+                self.dropped += 1
+            close = getattr(check, "close", None)
+            if close is not None:
+                close()
+            return
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self._run(loop, check))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, loop: asyncio.AbstractEventLoop,
+                   check: Awaitable[Any]) -> None:
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        async with semaphore:
+            try:
+                await check
+            except Exception as error:
+                loop.call_exception_handler({
+                    "message": f"Deferred contract check {check!r} failed",
+                    "exception": error,
+                })
+
+    async def join(self) -> None:
+        """Wait until the checks scheduled in the running loop are done."""
+        loop = asyncio.get_running_loop()
+        while True:
+            tasks = [task for task in self._tasks if task.get_loop() is loop]
+            if not tasks:
+                break
+            await asyncio.wait(tasks)
+
+
+defer = _Defer()
+
+
+# Shadow Verification
+# ===================
+#
+# Checks of latency critical code can be evaluated later by a background
+# thread. The caller only pays for a snapshot of the values, and for putting
+# them in a bounded queue. When the queue is full, the check is dropped, or
+# the caller waits if the block attribute is True. Failures are logged with
+# the values given to the check, so they can be reproduced.
+
+_logger = logging.getLogger("eiffel")
+
+TCheck = Tuple[Callable[..., Any], TArgs, TKwArgs]
+
+
+class _Shadow:
+    maxsize = 1024
+    block = False
+
+    def __init__(self) -> None:
+        self.dropped = 0
+        self._queue: Optional["queue.Queue[TCheck]"] = None
+        self._lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def __call__(self, check: Callable[..., Any], *args: Any,
+                 **kwargs: Any) -> None:
+        """Call the check with the arguments in the background thread."""
+        if not __debug__:
+            return
+        if self._queue is None:
+            self._start()
+        assert self._queue is not None
+        if self._queue.maxsize != self.maxsize:
+            self._resize()
+        try:
+            self._queue.put((check, args, kwargs), block=self.block)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._queue is None:
+                self._queue = queue.Queue(self.maxsize)
+                threading.Thread(
+                    target=self._work, name="eiffel.shadow", daemon=True
+                ).start()
+
+    def _resize(self) -> None:
+        assert self._queue is not None
+        with self._queue.mutex:
+            self._queue.maxsize = self.maxsize
+            self._queue.not_full.notify_all()
+
+    def _after_fork(self) -> None:
+        # The child process does not have the background thread, and the
+        # pending checks belong to the parent process.
+        self._queue = None
+        self._lock = threading.Lock()
+
+    def _work(self) -> None:
+        assert self._queue is not None
+        while True:
+            check, args, kwargs = self._queue.get()
+            try:
+                check(*args, **kwargs)
+            except Exception:
+                _logger.exception(
+                    "Shadow contract check %r failed with args=%r kwargs=%r",
+                    check, args, kwargs)
+            finally:
+                self._queue.task_done()
+
+    def join(self) -> None:
+        """Wait until the checks in the queue are done."""
+        if self._queue is not None:
+            self._queue.join()
+
+
+shadow = _Shadow()
+
+
+def _check_invariant(self: Any) -> None:
+    if self.__shadow__:
+        # The log of a failure shows the class and the snapshot.
+        shadow(_check_snapshot, type(self), self.__snapshot__())
+    else:
+        self.__invariant__()
+
+
+def _check_snapshot(cls: Type[Class], state: Dict[str, Any]) -> None:
+    """Check the invariant of an instance made from the snapshot."""
+    instance = cls.__new__(cls)
+    instance.__dict__.update(state)
+    instance.__invariant__()
+
+
+# Contract Fuzzing
+# ================
+#
+# A strategy draws random values and proposes simpler ones to shrink a
+# failing example. The fuzz function calls a routine, or a sequence of public
+# methods of a Class subclass, with drawn values. Calls rejected by the
+# "with eiffel.require:" block of the target are discarded. Any other
+# exception is a failure, that is shrunk and reported by raising Falsified.
+
+TCall = Tuple[Optional[str], TArgs]
+
+
+class Falsified(AssertionError):
+    """A contract was violated by a generated example."""
+
+    def __init__(self, message: str, calls: List[TCall]) -> None:
+        super().__init__(message)
+        self.calls = calls
+
+
+class _Strategy(abc.ABC):
+    @abc.abstractmethod
+    def draw(self, random: Random) -> Any:
+        """Return a random value."""
+
+    def shrink(self, value: Any) -> Iterator[Any]:
+        """Yield values simpler than the given one."""
+        return iter(())
+
+
+class _Integers(_Strategy):
+    def __init__(self, min_value: int, max_value: int) -> None:
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def draw(self, random: Random) -> int:
+        return random.randint(self.min_value, self.max_value)
+
+    def shrink(self, value: int) -> Iterator[int]:
+        # Move toward the value nearest to zero, halving the distance.
+        target = min(max(0, self.min_value), self.max_value)
+        delta = value - target
+        while delta:
+            yield value - delta
+            delta = delta // 2 if delta > 0 else -(-delta // 2)
+
+
+class _Floats(_Strategy):
+    def __init__(self, min_value: float, max_value: float) -> None:
+        self.min_value = min_value
+        self.max_value = max_value
+
+    def draw(self, random: Random) -> float:
+        return random.uniform(self.min_value, self.max_value)
+
+    def shrink(self, value: float) -> Iterator[float]:
+        target = min(max(0.0, self.min_value), self.max_value)
+        if value != target:
+            yield target
+        truncated = float(int(value))
+        if truncated != value \
+        and self.min_value <= truncated <= self.max_value:  # noqa
+            yield truncated
+
+
+class _SampledFrom(_Strategy):
+    def __init__(self, elements: Sequence[Any]) -> None:
+        self.elements = list(elements)
+
+    def draw(self, random: Random) -> Any:
+        return random.choice(self.elements)
+
+    def shrink(self, value: Any) -> Iterator[Any]:
+        # Prefer the elements that comes first.
+        yield from self.elements[:self.elements.index(value)]
+
+
+class _Lists(_Strategy):
+    def __init__(self, elements: _Strategy, min_size: int,
+                 max_size: int) -> None:
+        self.elements = elements
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def draw(self, random: Random) -> List[Any]:
+        size = random.randint(self.min_size, self.max_size)
+        return [self.elements.draw(random) for _ in range(size)]
+
+    def shrink(self, value: List[Any]) -> Iterator[List[Any]]:
+        if len(value) > self.min_size:
+            yield value[:self.min_size]
+            yield value[:max(self.min_size, len(value) // 2)]
+            for index in range(len(value)):
+                yield value[:index] + value[index + 1:]
+        for index, element in enumerate(value):
+            for simpler in self.elements.shrink(element):
+                yield value[:index] + [simpler] + value[index + 1:]
+
+
+class _Text(_Lists):
+    def draw(self, random: Random) -> str:  # type: ignore[override]
+        return "".join(super().draw(random))
+
+    def shrink(self, value: str) -> Iterator[str]:  # type: ignore[override]
+        for characters in super().shrink(list(value)):
+            yield "".join(characters)
+
+
+def integers(min_value: int = -2**31, max_value: int = 2**31 - 1) -> Any:
+    """Strategy that draws integers between both bounds inclusive."""
+    return _Integers(min_value, max_value)
+
+
+def floats(min_value: float = -1e9, max_value: float = 1e9) -> Any:
+    """Strategy that draws finite floats between both bounds."""
+    return _Floats(min_value, max_value)
+
+
+def sampled_from(elements: Sequence[Any]) -> Any:
+    """Strategy that picks one of the elements."""
+    return _SampledFrom(elements)
+
+
+def lists(elements: Any, min_size: int = 0, max_size: int = 10) -> Any:
+    """Strategy that draws lists of values drawn by the elements strategy."""
+    return _Lists(elements, min_size, max_size)
+
+
+def text(alphabet: str = string.printable, min_size: int = 0,
+         max_size: int = 10) -> Any:
+    """Strategy that draws strings made of alphabet characters."""
+    return _Text(_SampledFrom(alphabet), min_size, max_size)
+
+
+def _is_rejected(error: Exception, target: Any, name: Optional[str]) -> bool:
+    """Return True if the error comes from the preconditions of the call."""
+    code = getattr(error, "_eiffel_require", None)
+    if code is None:
+        return False
+    if name is None:
+        function = getattr(target, "__init__") \
+            if isinstance(target, type) else target
+    else:
+        function = getattr(target, name)
+    return getattr(inspect.unwrap(function), "__code__", None) is code
+
+
+def _run_calls(
+    target: Any, calls: List[TCall]
+) -> Tuple[List[TCall], Optional[Exception]]:
+    """Execute the calls. Return the ones accepted by the preconditions and
+    the exception raised by the last of them, if any."""
+    executed: List[TCall] = []
+    instance = None
+    for name, args in calls:
+        function = target if name is None else getattr(instance, name)
+        try:
+            result = function(*args)
+        except Exception as error:
+            if not _is_rejected(error, target, name):
+                executed.append((name, args))
+                return executed, error
+            if name is None:
+                return [], None
+            continue
+        executed.append((name, args))
+        if name is None:
+            instance = result
+    return executed, None
+
+
+def _shrink_calls(
+    target: Any,
+    calls: List[TCall],
+    strategies: Sequence[_Strategy],
+    methods: Dict[str, Sequence[_Strategy]],
+) -> Tuple[List[TCall], Exception]:
+    """Look for the simplest calls that still fails."""
+    calls, error = _run_calls(target, calls)
+    assert error is not None
+    improved = True
+    while improved:
+        improved = False
+
+        # Remove method calls, keeping the constructor.
+        for index in reversed(range(1, len(calls))):
+            executed, new_error = _run_calls(
+                target, calls[:index] + calls[index + 1:])
+            if new_error is not None:
+                calls, error, improved = executed, new_error, True
+
+        # Simplify arguments one by one.
+        index = 0
+        while index < len(calls):
+            name, args = calls[index]
+            for position, strategy in enumerate(
+                    strategies if name is None else methods[name]):
+                for value in strategy.shrink(args[position]):
+                    new_args = args[:position] + (value,) + args[position + 1:]
+                    executed, new_error = _run_calls(
+                        target,
+                        calls[:index] + [(name, new_args)] + calls[index + 1:])
+                    if new_error is not None and len(executed) > index:
+                        calls, error, improved = executed, new_error, True
+                        args = new_args
+                        break
+            index += 1
+    return calls, error
+
+
+def _describe(target: Any, calls: List[TCall], error: Exception) -> str:
+    lines = ["Falsifying example:"]
+    for name, args in calls:
+        arguments = ", ".join(map(repr, args))
+        if name is None:
+            if isinstance(target, type):
+                lines.append(f"    instance = {target.__name__}({arguments})")
+            else:
+                lines.append(f"    {target.__name__}({arguments})")
+        else:
+            lines.append(f"    instance.{name}({arguments})")
+    lines.append("".join(traceback.format_exception(
+        type(error), error, error.__traceback__)).rstrip())
+    return "\n".join(lines)
+
+
+def _fuzz_worker(
+    target: Any,
+    strategies: Sequence[_Strategy],
+    methods: Dict[str, Sequence[_Strategy]],
+    examples: int,
+    steps: int,
+    seed: int,
+) -> Tuple[int, Optional[Tuple[str, List[TCall]]]]:
+    """Run a stream of examples. Return the number of checked calls and the
+    description of the shrunk failure, if any."""
+    random = Random(seed)
+    names = sorted(methods)
+    checked = 0
+    for _ in range(examples):
+        calls: List[TCall] = [
+            (None, tuple(s.draw(random) for s in strategies))]
+        for _ in range(steps if names else 0):
+            name = random.choice(names)
+            calls.append(
+                (name, tuple(s.draw(random) for s in methods[name])))
+        executed, error = _run_calls(target, calls)
+        checked += len(executed)
+        if error is not None:
+            calls, error = _shrink_calls(target, executed, strategies, methods)
+            return checked, (_describe(target, calls, error), calls)
+    return checked, None
+
+
+def fuzz(
+    target: Any,
+    *strategies: Any,
+    methods: Optional[Dict[str, Sequence[Any]]] = None,
+    examples: int = 100,
+    steps: int = 10,
+    seed: Optional[int] = None,
+    processes: int = 1,
+) -> int:
+    """Check the contracts of the target with random examples.
+
+    The target is called with values drawn from the strategies. If the target
+    is a Class subclass, it is instantiated with those values, and then
+    methods are called ``steps`` times, picked randomly from the ``methods``
+    dictionary that maps method names to its argument strategies.
+
+    Examples are split in streams that run in ``processes`` worker processes.
+    In that case, the target and the strategies must be picklable.
+
+    Return the number of checked calls. Raise Falsified with the shrunk
+    reproducer on failure."""
+
+    methods = dict(methods or {})
+    seed = Random().getrandbits(32) if seed is None else seed
+    if processes <= 1:
+        streams = [_fuzz_worker(
+            target, strategies, methods, examples, steps, seed)]
+    else:
+        sizes = [examples // processes + (index < examples % processes)
+                 for index in range(processes)]
+        with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+            streams = list(executor.map(
+                _fuzz_worker,
+                *zip(*[(target, strategies, methods, size, steps, seed + index)
+                       for index, size in enumerate(sizes)])))
+    for _, failure in streams:
+        if failure is not None:
+            raise Falsified(*failure)
+    return sum(checked for checked, _ in streams)
+
+
+# Contract Coverage
+# =================
+#
+# Count how many times each assertion of a precondition block, a
+# postcondition block or an __invariant__ method is executed, and how many
+# times it fails. Only the code of the contracts is instrumented. On Python
+# 3.12+ sys.monitoring is used, and the lines that are not clauses are
+# disabled after its first execution. Older versions use sys.settrace, with a
+# local trace function installed only in the contract frames.
+
+_contract_codes: "weakref.WeakSet[types.CodeType]" = weakref.WeakSet()
+_coverage: Optional["Coverage"] = None
+
+
+def _register_contract(function: Callable[..., Any]) -> None:
+    code = getattr(inspect.unwrap(function), "__code__", None)
+    if code is not None:
+        _contract_codes.add(code)
+        if _coverage is not None:
+            _coverage._instrument(code)
+
+
+def _is_require(node: ast.expr) -> bool:
+    return isinstance(node, ast.Attribute) and node.attr == "require" \
+        or isinstance(node, ast.Name) and node.id == "require"
+
+
+def _find_clauses(
+    nodes: List[ast.stmt], kind: Optional[str], clauses: Dict[int, str]
+) -> None:
+    """Map the line of each assert statement to the kind of its block."""
+    for node in nodes:
+        if isinstance(node, ast.Assert):
+            if kind:
+                clauses[node.lineno] = kind
+        elif isinstance(node, (ast.With, ast.AsyncWith)) \
+        and any(_is_require(item.context_expr) for item in node.items):  # noqa
+            _find_clauses(node.body, kind or "require", clauses)
+        elif isinstance(node, ast.Try):
+            _find_clauses(node.body, kind, clauses)
+            for handler in node.handlers:
+                _find_clauses(handler.body, kind, clauses)
+            _find_clauses(node.orelse, kind, clauses)
+            _find_clauses(node.finalbody, kind or "ensure", clauses)
+        elif isinstance(node, getattr(ast, "Match", ())):
+            for case in node.cases:  # type: ignore[attr-defined]
+                _find_clauses(case.body, kind, clauses)
+        elif not isinstance(
+                node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            _find_clauses(getattr(node, "body", []), kind, clauses)
+            _find_clauses(getattr(node, "orelse", []), kind, clauses)
+
+
+def _code_clauses(code: types.CodeType) -> Dict[int, str]:
+    """Return the clauses of the function, keyed by absolute line number."""
+    try:
+        lines, start = inspect.getsourcelines(code)
+        tree = ast.parse(textwrap.dedent("".join(lines)))
+    except (OSError, TypeError, SyntaxError):
+        return {}
+    function = tree.body[0] if tree.body else None
+    if not isinstance(function, (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return {}
+    clauses: Dict[int, str] = {}
+    kind = "invariant" \
+        if code.co_name in ("__invariant__", "__ainvariant__") else None
+    _find_clauses(function.body, kind, clauses)
+    return {line + start - 1: kind for line, kind in clauses.items()}
+
+
+class Coverage:
+    """Record the hits and failures of each contract clause.
+
+    ``clauses`` maps file names to a dictionary that maps line numbers to a
+    ``[kind, hits, failures]`` list, where kind is "require", "ensure" or
+    "invariant"."""
+
+    def __init__(self) -> None:
+        self.clauses: Dict[str, Dict[int, List[Any]]] = {}
+        self._lines: Dict[types.CodeType, Dict[int, List[Any]]] = {}
+        self._tool: Optional[int] = None
+        self._previous_trace: Any = None
+        self._previous_thread_trace: Any = None
+        self._failed: Optional[Tuple[types.FrameType, int]] = None
+
+    def __enter__(self) -> "Coverage":
+        self.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        """Start recording. Only one instance can record at the same time."""
+        global _coverage
+        if _coverage is not None:
+            raise RuntimeError("other 'Coverage' instance is recording.")
+        if sys.version_info >= (3, 12):
+            # Prefer the ids that are not reserved for debuggers, coverage
+            # tools, profilers and optimizers.
+            free = [tool for tool in (3, 4, 2, 1, 5, 0)
+                    if sys.monitoring.get_tool(tool) is None]
+            if not free:
+                raise RuntimeError("all 'sys.monitoring' tools are in use.")
+            sys.monitoring.use_tool_id(free[0], "eiffel")
+            self._tool = free[0]
+            events = sys.monitoring.events
+            sys.monitoring.register_callback(
+                self._tool, events.LINE, self._line_event)
+            sys.monitoring.register_callback(
+                self._tool, events.RAISE, self._raise_event)
+
+            # RAISE can not be a local event.
+            sys.monitoring.set_events(self._tool, events.RAISE)
+        else:
+            self._previous_trace = sys.gettrace()
+            if sys.version_info >= (3, 10):
+                self._previous_thread_trace = threading.gettrace()
+            else:
+                self._previous_thread_trace = \
+                    threading._trace_hook  # type: ignore[attr-defined]
+            sys.settrace(self._call_event)
+            threading.settrace(self._call_event)
+        try:
+            for code in list(_contract_codes):
+                self._instrument(code)
+        except BaseException:
+            self._release()
+            raise
+        _coverage = self
+
+    def stop(self) -> None:
+        """Stop recording."""
+        global _coverage
+        if _coverage is not self:
+            return
+        _coverage = None
+        self._release()
+
+    def _release(self) -> None:
+        if sys.version_info >= (3, 12):
+            if self._tool is not None:
+                events = sys.monitoring.events
+                sys.monitoring.set_events(self._tool, 0)
+                for code in self._lines:
+                    sys.monitoring.set_local_events(self._tool, code, 0)
+                sys.monitoring.register_callback(
+                    self._tool, events.LINE, None)
+                sys.monitoring.register_callback(
+                    self._tool, events.RAISE, None)
+                sys.monitoring.free_tool_id(self._tool)
+                self._tool = None
+        else:
+            sys.settrace(self._previous_trace)
+            threading.settrace(self._previous_thread_trace)
+            self._failed = None
+
+    def _instrument(self, code: types.CodeType) -> None:
+        if code in self._lines:
+            return
+        filename = self.clauses.setdefault(code.co_filename, {})
+        self._lines[code] = {
+            line: filename.setdefault(line, [kind, 0, 0])
+            for line, kind in _code_clauses(code).items()}
+        if sys.version_info >= (3, 12):
+            if self._lines[code] and self._tool is not None:
+                sys.monitoring.set_local_events(
+                    self._tool, code, sys.monitoring.events.LINE)
+
+    # sys.monitoring callbacks
+
+    if sys.version_info >= (3, 12):
+        def _line_event(self, code: types.CodeType, line: int) -> Any:
+            clause = self._lines[code].get(line)
+            if clause is None:
+                return sys.monitoring.DISABLE
+            clause[1] += 1
+
+        def _raise_event(self, code: types.CodeType, offset: int,
+                         exception: BaseException) -> None:
+            lines = self._lines.get(code)
+            if lines and isinstance(exception, AssertionError):
+                for start, end, line in code.co_lines():
+                    if start <= offset < end:
+                        clause = lines.get(line)  # type: ignore[arg-type]
+                        if clause is not None:
+                            clause[2] += 1
+                        break
+
+    # sys.settrace callbacks
+
+    def _call_event(self, frame: types.FrameType, event: str,
+                    arg: Any) -> Any:
+        if self._lines.get(frame.f_code):
+            return self._local_event
+        return None
+
+    def _local_event(self, frame: types.FrameType, event: str,
+                     arg: Any) -> Any:
+        if event == "line":
+            # Python 3.9 repeats the line of the failed assertion when the
+            # exception leaves a with block.
+            failed, self._failed = self._failed, None
+            if failed == (frame, frame.f_lineno):
+                return self._local_event
+            clause = self._lines[frame.f_code].get(frame.f_lineno)
+            if clause is not None:
+                clause[1] += 1
+        elif event == "exception" and isinstance(arg[1], AssertionError):
+            clause = self._lines[frame.f_code].get(frame.f_lineno)
+            if clause is not None:
+                clause[2] += 1
+                self._failed = (frame, frame.f_lineno)
+        return self._local_event
+
+    # Reports
+
+    def update(self, other: "Coverage") -> None:
+        """Add the counts of other report to this one."""
+        for filename, lines in other.clauses.items():
+            clauses = self.clauses.setdefault(filename, {})
+            for line, (kind, hits, failures) in lines.items():
+                clause = clauses.setdefault(line, [kind, 0, 0])
+                clause[1] += hits
+                clause[2] += failures
+
+    def dump(self, file: IO[str]) -> None:
+        """Write the report as compact JSON."""
+        json.dump(self.clauses, file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, file: IO[str]) -> "Coverage":
+        """Read a report written by the dump method."""
+        coverage = cls()
+        for filename, lines in json.load(file).items():
+            coverage.clauses[filename] = {
+                int(line): clause for line, clause in lines.items()}
+        return coverage
@@ -1,7 +1,13 @@
 # type: ignore
 
+import asyncio
 import functools
+import io
+import os
+import sys
+import threading
 import unittest
+import warnings
 from unittest import mock
 
 import eiffel
@@ -10,6 +16,17 @@ import eiffel
 global_variable = 0
 
 
+@eiffel.routine
+def integer_square_root(n):
+    with eiffel.require:
+        assert n >= 0
+    try:
+        result = int(n ** 0.5)
+        return result
+    finally:
+        assert result * result <= n < (result + 1) * (result + 1)
+
+
 # Test performed in debug mode
 # ============================
 
@@ -72,6 +89,100 @@ class ClassCaseDebug(unittest.TestCase):
         with self.assertRaises(AssertionError):
             Employee(name="python")
 
+    def test_check_invariant_once_on_nested_calls(self):
+
+        class Account(eiffel.Class):
+            def __init__(self):
+                self.balance = 0
+
+            def deposit(self, amount):
+                self.balance = self.balance + amount
+
+            def deposit_twice(self, amount):
+                self.deposit(amount)
+                self.deposit(amount)
+
+        account = Account()
+        account.__invariant__ = mock.Mock()
+        account.__invariant__.reset_mock()
+        account.deposit_twice(10)
+        account.__invariant__.assert_called_once_with()
+
+    def test_inner_state_may_break_the_invariant(self):
+
+        class Pair(eiffel.Class):
+            def __init__(self):
+                self.first = self.second = 0
+
+            def set_both(self, value):
+                self.first = value
+                self.second = value
+
+            def __invariant__(self):
+                assert self.first == getattr(self, "second", 0)
+
+        pair = Pair()
+        pair.set_both(5)
+        self.assertEqual((pair.first, pair.second), (5, 5))
+
+    def test_other_instances_are_checked_on_nested_calls(self):
+
+        class Node(eiffel.Class):
+            def __init__(self, value):
+                self.value = value
+
+            def copy_to(self, other):
+                other.set_value(self.value)
+
+            def set_value(self, value):
+                self.value = value
+
+            def __invariant__(self):
+                assert self.value >= 0
+
+        source, target = Node(1), Node(2)
+        target.__invariant__ = mock.Mock()
+        source.copy_to(target)
+        target.__invariant__.assert_called()
+
+    def test_overridden_methods(self):
+
+        class Base(eiffel.Class):
+            def __init__(self):
+                self.value = 0
+
+            def step(self):
+                self.value = self.value + 1
+
+        class Child(Base):
+            def step(self):
+                self.value = self.value + 1
+                self.value = self.value + 1
+                self.value = self.value + 1
+
+        child = Child()
+        child.__invariant__ = mock.Mock()
+        child.__invariant__.reset_mock()
+        child.step()
+        child.__invariant__.assert_called_once_with()
+
+    def test_disable_the_invariant_of_an_instance(self):
+
+        class Negative(eiffel.Class):
+            def __init__(self, value):
+                self.value = value
+
+            def set_value(self, value):
+                self.value = value
+
+            def __invariant__(self):
+                assert self.value < 0
+
+        negative = Negative(-1)
+        negative._invariant_enabled = False
+        negative.set_value(1)
+        negative.value = 2
+
     def test_that_instance_do_not_change_the_class(self):
 
         class Object(eiffel.Class):
@@ -303,6 +414,680 @@ class __setattr__and__delattr__CaseDebug(unittest.TestCase):
         my_object.__invariant__.assert_called()
 
 
+@unittest.skipUnless(__debug__, "Assertions are performed in debug mode only.")
+class OldStateCaseDebug(unittest.TestCase):
+    def setUp(self):
+
+        class Account(eiffel.Class):
+            currency = "USD"
+
+            def __init__(self):
+                self.balance = 0
+                self.owner = "python"
+
+            def deposit(self, amount):
+                try:
+                    self.balance = self.balance + amount
+                finally:
+                    assert self.balance == eiffel.old(self).balance + amount
+                    assert self.owner == eiffel.old(self).owner
+
+            def buggy_deposit(self, amount):
+                try:
+                    self.deposit(amount)
+                    self.deposit(amount)
+                finally:
+                    assert self.balance == eiffel.old(self).balance + amount
+
+        self.Account = Account
+
+    def test_entry_value(self):
+        account = self.Account()
+        account.deposit(10)
+        account.deposit(5)
+        self.assertEqual(account.balance, 15)
+
+    def test_entry_value_of_nested_calls(self):
+        account = self.Account()
+        account.deposit(1)
+        with self.assertRaises(AssertionError):
+            account.buggy_deposit(10)
+
+    def test_class_attribute_and_new_attribute(self):
+        test = self
+
+        class Account(self.Account):
+            def convert(self, currency):
+                try:
+                    self.currency = currency
+                    self.rate = 2
+                finally:
+                    assert eiffel.old(self).currency == "USD"
+                    with test.assertRaises(AttributeError):
+                        eiffel.old(self).rate
+
+        Account().convert("EUR")
+
+    def test_deleted_attribute(self):
+
+        class Account(self.Account):
+            def close(self):
+                try:
+                    del self.owner
+                finally:
+                    assert eiffel.old(self).owner == "python"
+
+        Account().close()
+
+    def test_outside_of_a_public_method(self):
+        message = r"'old' can only be called with an 'eiffel.Class' " \
+                  r"instance inside one of its public methods."
+        with self.assertRaisesRegex(ValueError, message):
+            eiffel.old(self.Account())
+
+    def test_async_method(self):
+
+        class Account(self.Account):
+            async def withdraw(self, amount):
+                try:
+                    await asyncio.sleep(0)
+                    self.balance = self.balance - amount
+                finally:
+                    assert self.balance == eiffel.old(self).balance - amount
+
+        async def main(account):
+            await account.withdraw(1)
+            await account.withdraw(2)
+            return account.balance
+
+        self.assertEqual(asyncio.run(main(Account())), -3)
+
+        # The second call starts with balance 0, the first one changes it.
+        async def concurrent(account):
+            await asyncio.gather(account.withdraw(1), account.withdraw(2))
+
+        with self.assertRaises(AssertionError):
+            asyncio.run(concurrent(Account()))
+
+    def test_changes_of_other_threads(self):
+        entry = []
+        entered, changed = threading.Event(), threading.Event()
+
+        class Pair(eiffel.Class):
+            def __init__(self):
+                self.a = self.b = 0
+
+            def slow(self):
+                try:
+                    entered.set()
+                    changed.wait()
+                    self.a = 1
+                finally:
+                    entry.append((eiffel.old(self).a, eiffel.old(self).b))
+
+        pair = Pair()
+        thread = threading.Thread(target=pair.slow)
+        thread.start()
+        entered.wait()
+        pair.b = 42
+        changed.set()
+        thread.join()
+        self.assertEqual(entry, [(0, 0)])
+        self.assertEqual((pair.a, pair.b), (1, 42))
+
+    def test_property(self):
+
+        class Temperature(eiffel.Class):
+            def __init__(self):
+                self._celsius = 0
+
+            @property
+            def celsius(self):
+                return self._celsius
+
+            @celsius.setter
+            def celsius(self, value):
+                self._celsius = value
+
+            def heat(self, degrees):
+                try:
+                    self.celsius = self.celsius + degrees
+                finally:
+                    assert eiffel.old(self).celsius == 0
+                    assert self.celsius == degrees
+
+        Temperature().heat(5)
+
+    def test_method(self):
+
+        class Wallet(eiffel.Class):
+            def __init__(self):
+                self.coins = []
+
+            def balance(self):
+                return sum(self.coins)
+
+            def total(self):
+                return self.balance()
+
+            def deposit(self, amount):
+                try:
+                    self.coins = self.coins + [amount]
+                finally:
+                    assert eiffel.old(self).balance() == 0
+                    assert eiffel.old(self).total() == 0
+                    assert self.balance() == amount
+
+        Wallet().deposit(10)
+
+    def test_attributes_with_private_names(self):
+
+        class Journal(eiffel.Class):
+            def __init__(self):
+                self._log = []
+                self._instance = None
+
+            def write(self, entry):
+                try:
+                    self._log = self._log + [entry]
+                    self._instance = entry
+                finally:
+                    assert eiffel.old(self)._log == []
+                    assert eiffel.old(self)._instance is None
+
+        Journal().write("entry")
+
+
+@unittest.skipUnless(__debug__, "Assertions are performed in debug mode only.")
+class AsyncCaseDebug(unittest.TestCase):
+    def test_routine(self):
+
+        @eiffel.routine
+        async def next_integer(n):
+            with eiffel.require:
+                assert n >= 0
+            try:
+                await asyncio.sleep(0)
+                result = n + 1
+                return result
+            finally:
+                if eiffel.old:
+                    assert result == eiffel.old.result + 1
+
+        async def main():
+            self.assertEqual(await next_integer(1), 2)
+            self.assertEqual(await next_integer(2), 3)
+            with self.assertRaises(AssertionError):
+                await next_integer(-1)
+            with self.assertRaises(AssertionError):
+                await next_integer(7)
+
+        asyncio.run(main())
+
+    def test_async_invariant(self):
+
+        class Positive(eiffel.Class):
+            def __init__(self, value):
+                self.value = value
+
+            async def set_value(self, value):
+                await asyncio.sleep(0)
+                self.value = value
+                await asyncio.sleep(0)
+
+            async def __ainvariant__(self):
+                await asyncio.sleep(0)
+                assert self.value >= 0
+
+        async def main():
+            positive = Positive(1)
+            await positive.set_value(-1)
+
+        with self.assertRaises(AssertionError):
+            asyncio.run(main())
+
+    def test_invariant_is_not_checked_while_the_method_awaits(self):
+
+        class Pair(eiffel.Class):
+            def __init__(self):
+                self.first = self.second = 0
+
+            async def set_both(self, value):
+                self.first = value
+                await asyncio.sleep(0)
+                self.second = value
+
+            def __invariant__(self):
+                assert self.first == getattr(self, "second", 0)
+
+        async def main():
+            pair = Pair()
+            await pair.set_both(1)
+            self.assertEqual((pair.first, pair.second), (1, 1))
+
+        asyncio.run(main())
+
+    def test_task_created_inside_a_method_checks_the_invariant(self):
+
+        class Positive(eiffel.Class):
+            def __init__(self):
+                self.value = 1
+
+            async def start(self):
+                return asyncio.get_running_loop().create_task(self._break())
+
+            async def _break(self):
+                self.value = -1
+
+            def __invariant__(self):
+                assert self.value >= 0
+
+        async def main():
+            task = await Positive().start()
+            await task
+
+        with self.assertRaises(AssertionError):
+            asyncio.run(main())
+
+    def test_deferred_checks(self):
+        running = []
+        errors = []
+
+        async def check(value):
+            running.append(value)
+            self.assertLessEqual(len(running), eiffel.defer.limit)
+            await asyncio.sleep(0.001)
+            running.remove(value)
+            assert value != 3
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(
+                lambda loop, context: errors.append(context["exception"]))
+            for value in range(20):
+                eiffel.defer(check(value))
+            await eiffel.defer.join()
+
+        asyncio.run(main())
+        self.assertEqual(len(errors), 1)
+        self.assertIsInstance(errors[0], AssertionError)
+
+    def test_drop_deferred_checks_when_too_many_are_pending(self):
+        checked = []
+
+        async def check(value):
+            await asyncio.sleep(0)
+            checked.append(value)
+
+        async def main():
+            for value in range(10):
+                eiffel.defer(check(value))
+            await eiffel.defer.join()
+
+        dropped = eiffel.defer.dropped
+        with mock.patch.object(eiffel.defer, "maxsize", 4):
+            asyncio.run(main())
+        self.assertEqual(checked, [0, 1, 2, 3])
+        self.assertEqual(eiffel.defer.dropped, dropped + 6)
+
+    def test_forget_old_namespace_of_finished_calls(self):
+
+        @eiffel.routine
+        def identity(value):
+            try:
+                return value
+            finally:
+                if eiffel.old:
+                    assert eiffel.old.value is not None
+
+        @eiffel.routine
+        async def async_identity(value):
+            try:
+                return value
+            finally:
+                if eiffel.old:
+                    assert eiffel.old.value is not None
+
+        namespace = dict(eiffel.old.namespace)
+        identity(1)
+        identity(2)
+        asyncio.run(async_identity(1))
+        asyncio.run(async_identity(2))
+        self.assertEqual(eiffel.old.namespace, namespace)
+
+    def test_old_of_overlapping_calls(self):
+
+        @eiffel.routine
+        async def increment(value):
+            x = value + 1
+            try:
+                await asyncio.sleep(0)
+                return x
+            finally:
+                if eiffel.old:
+                    await asyncio.sleep(0)
+                    assert eiffel.old.x is not None
+
+        async def main():
+            await increment(0)
+            return await asyncio.gather(increment(2), increment(3))
+
+        self.assertEqual(asyncio.run(main()), [3, 4])
+
+
+@unittest.skipUnless(__debug__, "Assertions are performed in debug mode only.")
+class ShadowCaseDebug(unittest.TestCase):
+    def test_checks_run_in_the_background(self):
+        threads = []
+
+        def check(value):
+            threads.append(threading.current_thread().name)
+            assert value > 0
+
+        with self.assertLogs("eiffel", level="ERROR") as logs:
+            eiffel.shadow(check, 1)
+            eiffel.shadow(check, value=-1)
+            eiffel.shadow.join()
+
+        self.assertEqual(threads, ["eiffel.shadow"] * 2)
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("kwargs={'value': -1}", logs.output[0])
+        self.assertIn("AssertionError", logs.output[0])
+
+    def test_invariant_of_a_snapshot(self):
+
+        class Positive(eiffel.Class):
+            __shadow__ = True
+
+            def __init__(self, value):
+                self.value = value
+
+            def set_value(self, value):
+                self.value = value
+
+            def __invariant__(self):
+                assert self.value >= 0
+
+        positive = Positive(1)
+        with self.assertLogs("eiffel", level="ERROR") as logs:
+            positive.set_value(-1)
+            positive.set_value(2)
+            eiffel.shadow.join()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("{'value': -1}", logs.output[0])
+        self.assertIn("AssertionError", logs.output[0])
+
+    def test_custom_snapshot(self):
+        release = threading.Event()
+
+        class Sorted(eiffel.Class):
+            __shadow__ = True
+
+            def __init__(self):
+                self.items = []
+
+            def add(self, item):
+                self.items.append(item)
+                self.items.sort()
+
+            def reverse(self):
+                self.items.reverse()
+
+            def __snapshot__(self):
+                return {"items": list(self.items)}
+
+            def __invariant__(self):
+                assert self.items == sorted(self.items)
+
+        collection = Sorted()
+        eiffel.shadow(release.wait)
+        with self.assertLogs("eiffel", level="ERROR") as logs:
+            collection.add(1)
+            collection.add(2)
+            collection.reverse()
+            collection.add(3)
+            release.set()
+            eiffel.shadow.join()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn("{'items': [2, 1]}", logs.output[0])
+
+    def test_drop_checks_when_the_queue_is_full(self):
+        eiffel.shadow(int)  # start the background thread
+        eiffel.shadow.join()
+        release = threading.Event()
+        dropped = eiffel.shadow.dropped
+        with mock.patch.object(eiffel.shadow, "maxsize", 1):
+            eiffel.shadow(release.wait)
+            eiffel.shadow(release.wait)
+            eiffel.shadow(release.wait)
+            release.set()
+            eiffel.shadow.join()
+        self.assertGreaterEqual(eiffel.shadow.dropped, dropped + 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "Requires os.fork.")
+    def test_checks_run_in_a_forked_process(self):
+        release = threading.Event()
+        eiffel.shadow(release.wait)
+        with warnings.catch_warnings():
+            # Python 3.12+ warns about forking a process with threads.
+            warnings.simplefilter("ignore", DeprecationWarning)
+            pid = os.fork()
+        if pid == 0:
+            done = threading.Event()
+            eiffel.shadow(done.set)
+            os._exit(0 if done.wait(5) else 1)
+        release.set()
+        eiffel.shadow.join()
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+
+
+@unittest.skipUnless(__debug__, "Assertions are performed in debug mode only.")
+class FuzzCaseDebug(unittest.TestCase):
+    def test_routine_that_fulfill_its_contract(self):
+        checked = eiffel.fuzz(integer_square_root,
+                              eiffel.integers(-1000, 1000),
+                              examples=200, seed=0)
+        self.assertGreater(checked, 0)
+        self.assertLess(checked, 200)  # negative numbers are rejected
+
+    def test_parallel_streams(self):
+        checked = eiffel.fuzz(integer_square_root,
+                              eiffel.integers(0, 10**6),
+                              examples=100, seed=0, processes=2)
+        self.assertEqual(checked, 100)
+
+    def test_shrink_postcondition_violation(self):
+
+        @eiffel.routine
+        def absolute_value(value):
+            try:
+                result = value if value > 10 else -value
+                return result
+            finally:
+                assert result >= 0
+
+        with self.assertRaises(eiffel.Falsified) as context:
+            eiffel.fuzz(absolute_value, eiffel.integers(0, 1000), seed=0)
+        self.assertEqual(context.exception.calls, [(None, (1,))])
+        self.assertIn("absolute_value(1)", str(context.exception))
+
+    def test_nested_precondition_is_a_failure(self):
+
+        @eiffel.routine
+        def positive(value):
+            with eiffel.require:
+                assert value > 0
+            return value
+
+        @eiffel.routine
+        def caller(value):
+            return positive(value)
+
+        with self.assertRaises(eiffel.Falsified) as context:
+            eiffel.fuzz(caller, eiffel.integers(-10, 10), seed=0)
+        self.assertEqual(context.exception.calls, [(None, (0,))])
+
+    def test_shrink_method_calls(self):
+
+        class Stack(eiffel.Class):
+            items = []
+
+            def __init__(self, capacity):
+                self.capacity = capacity
+
+            def push(self, item):
+                with eiffel.require:
+                    assert len(self.items) <= self.capacity  # off by one
+                self.items = self.items + [item]
+
+            def pop(self):
+                with eiffel.require:
+                    assert self.items
+                self.items = self.items[:-1]
+
+            def __invariant__(self):
+                assert len(self.items) <= self.capacity
+
+        with self.assertRaises(eiffel.Falsified) as context:
+            eiffel.fuzz(Stack, eiffel.integers(1, 5),
+                        methods={"push": [eiffel.text()], "pop": []},
+                        seed=0)
+        calls = context.exception.calls
+        self.assertEqual(calls, [(None, (1,)), ("push", ("",)),
+                                 ("push", ("",))])
+
+    def test_shrink_big_integers(self):
+        strategy = eiffel.integers(0, 10**30)
+        value = 10**30 - 1
+        self.assertEqual(list(strategy.shrink(value))[:3],
+                         [0, value - value // 2, value - value // 4])
+        self.assertEqual(list(eiffel.integers(-10, -3).shrink(-10)),
+                         [-3, -7, -9])
+
+    def test_shrink_lists_and_text(self):
+
+        @eiffel.routine
+        def join(words):
+            try:
+                result = " ".join(words)
+                return result
+            finally:
+                assert "a" not in result
+
+        with self.assertRaises(eiffel.Falsified) as context:
+            eiffel.fuzz(join, eiffel.lists(eiffel.text("abc")), seed=0)
+        self.assertEqual(context.exception.calls, [(None, (["a"],))])
+
+
+@unittest.skipUnless(__debug__, "Assertions are performed in debug mode only.")
+class CoverageCaseDebug(unittest.TestCase):
+    def clause(self, coverage, function, line):
+        code = getattr(function, "__wrapped__", function).__code__
+        return coverage.clauses[code.co_filename][code.co_firstlineno + line]
+
+    def test_routine_clauses(self):
+
+        @eiffel.routine
+        def divide(dividend, divisor):
+            with eiffel.require:
+                assert divisor != 0
+            try:
+                result = dividend/divisor
+                return result
+            finally:
+                assert result * divisor == dividend
+
+        with eiffel.Coverage() as coverage:
+            divide(4, 2)
+            divide(6, 3)
+            with self.assertRaises(AssertionError):
+                divide(1, 0)
+        divide(1, 1)
+
+        self.assertEqual(self.clause(coverage, divide, 3), ["require", 3, 1])
+        self.assertEqual(self.clause(coverage, divide, 8), ["ensure", 2, 0])
+
+    def test_invariant_clauses(self):
+
+        class Positive(eiffel.Class):
+            def __init__(self, value):
+                self.value = value
+
+            def __invariant__(self):
+                assert self.value >= 0
+
+        with eiffel.Coverage() as coverage:
+            Positive(1)
+            with self.assertRaises(AssertionError):
+                Positive(-1)
+
+        self.assertEqual(self.clause(coverage, Positive.__invariant__, 1),
+                         ["invariant", 2, 1])
+
+    def test_dump_load_and_update(self):
+
+        @eiffel.routine
+        def identity(value):
+            with eiffel.require:
+                assert value is not None
+            return value
+
+        with eiffel.Coverage() as first:
+            identity(1)
+        with eiffel.Coverage() as second:
+            identity(2)
+            identity(3)
+
+        file = io.StringIO()
+        second.dump(file)
+        file.seek(0)
+        first.update(eiffel.Coverage.load(file))
+        self.assertEqual(self.clause(first, identity, 3), ["require", 3, 0])
+
+    def test_failed_start_does_not_keep_recording(self):
+        with mock.patch.object(eiffel.Coverage, "_instrument",
+                               side_effect=MemoryError):
+            with self.assertRaises(MemoryError):
+                eiffel.Coverage().start()
+        with eiffel.Coverage():
+            pass
+
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "Python 3.12+ only.")
+    def test_all_monitoring_tools_in_use(self):
+        with mock.patch("sys.monitoring.get_tool", return_value="other"):
+            with self.assertRaisesRegex(RuntimeError, "tools are in use"):
+                eiffel.Coverage().start()
+        with eiffel.Coverage():
+            pass
+
+    @unittest.skipUnless(hasattr(sys, "monitoring"), "Python 3.12+ only.")
+    def test_does_not_take_the_debugger_tool(self):
+        with eiffel.Coverage():
+            self.assertIsNone(
+                sys.monitoring.get_tool(sys.monitoring.DEBUGGER_ID))
+            self.assertEqual(sys.monitoring.get_tool(3), "eiffel")
+
+    @unittest.skipIf(hasattr(sys, "monitoring"), "Python 3.11- only.")
+    def test_restore_the_thread_tracer(self):
+        def tracer(frame, event, arg):
+            return None
+
+        threading.settrace(tracer)
+        try:
+            with eiffel.Coverage():
+                pass
+            self.assertIs(threading._trace_hook, tracer)
+            self.assertIsNone(sys.gettrace())
+        finally:
+            threading.settrace(None)
+
+    def test_only_one_recording_instance(self):
+        with eiffel.Coverage():
+            with self.assertRaises(RuntimeError):
+                eiffel.Coverage().start()
+
+
 # Test performed on optimized mode
 # ================================
 